@@ -0,0 +1,239 @@
+"""
+Offline batch processing for folders of voice notes / text queries.
+
+Runs every item through the same pipeline as the /voice_chat/ endpoint
+(speech-to-text -> language -> intent -> LLM -> tip -> optional TTS).
+
+Usage:
+    python batch_process.py INPUT --output results.jsonl [--parquet results.parquet]
+                            [--concurrency 4] [--lang yo] [--no-tts] [--llm-timeout 120]
+
+INPUT is either a directory (audio files and .txt files, one query per file)
+or a JSONL manifest with one object per line:
+    {"id": "q1", "text": "How do I get a loan?", "lang": "en", "user_id": "officer-7"}
+    {"id": "q2", "audio": "notes/q2.wav"}
+
+Results are appended to the JSONL output as each item finishes, so an
+interrupted run can be restarted with the same arguments and will skip
+items that already succeeded (failed items are retried, including items
+answered with the local fallback because the LLM failed or timed out).
+
+Items are stateless unless they carry a user_id (or --user-id is given);
+only then are they added to conversation memory.
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import asyncio
+import json
+import time
+
+from main import process_message, normalize_language, ISO_MAP
+from utils.speech_to_text import transcribe_audio_bytes
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".ogg", ".flac", ".webm"}
+TEXT_EXTENSIONS = {".txt"}
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return number
+
+
+def load_items(input_path: str):
+    """Build the work list from a directory or a JSONL manifest."""
+    items = []
+    if os.path.isdir(input_path):
+        for name in sorted(os.listdir(input_path)):
+            path = os.path.join(input_path, name)
+            ext = os.path.splitext(name)[1].lower()
+            if ext in AUDIO_EXTENSIONS:
+                items.append({"id": name, "audio": path})
+            elif ext in TEXT_EXTENSIONS:
+                with open(path, "r", encoding="utf-8") as f:
+                    items.append({"id": name, "text": f.read().strip()})
+        return items
+
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item.setdefault("id", str(line_no))
+            if item.get("audio") and not os.path.isabs(item["audio"]):
+                item["audio"] = os.path.join(base_dir, item["audio"])
+            items.append(item)
+    return items
+
+
+def load_checkpoint(output_path: str) -> set:
+    """Ids that already succeeded in the output file (the output doubles as the checkpoint)."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partially written last line of an interrupted run
+            if "id" in record and "error" not in record:
+                done.add(record["id"])
+    return done
+
+
+async def transcribe_item(item: dict, lang: str = None) -> str:
+    with open(item["audio"], "rb") as f:
+        audio_bytes = await asyncio.to_thread(f.read)
+    suffix = os.path.splitext(item["audio"])[1] or ".wav"
+    iso_lang = ISO_MAP.get(normalize_language(lang), "en") if lang else None
+    text = await transcribe_audio_bytes(audio_bytes, language=iso_lang, suffix=suffix)
+    if not text or "Error transcribing" in text:
+        print(f"⚠️ Retrying {item['id']} with auto-detect...")
+        text = await transcribe_audio_bytes(audio_bytes, language=None, suffix=suffix)
+    if not text or "Error transcribing" in text:
+        raise RuntimeError("Speech-to-text failed")
+    return text
+
+
+async def process_item(item: dict, args) -> dict:
+    timings = {}
+    started = time.perf_counter()
+    lang = item.get("lang") or args.lang
+    try:
+        if item.get("text"):
+            user_text = item["text"]
+        elif item.get("audio"):
+            stt_start = time.perf_counter()
+            user_text = await transcribe_item(item, lang)
+            timings["speech_to_text"] = time.perf_counter() - stt_start
+        else:
+            raise ValueError("Item has neither 'text' nor 'audio'.")
+
+        user_id = item.get("user_id") or args.user_id
+        result = await process_message(
+            user_text,
+            user_id=user_id or f"batch:{item['id']}",
+            lang_hint=lang,
+            # Offline: wait for the real LLM answer instead of the interactive local fallback
+            deadline=args.llm_timeout,
+            tts=not args.no_tts,
+            timings=timings,
+            remember=user_id is not None
+        )
+        # A local fallback answer (LLM failed, timed out or was saturated) is kept in the record
+        # but marked as an error, so the checkpoint retries the item on the next run.
+        if "error" not in result and result.get("response_source") not in ("llm", "cache"):
+            result["error"] = f"LLM unavailable, got a {result.get('response_source')} answer"
+    except Exception as e:
+        print(f"❌ Batch item {item['id']} failed: {e}")
+        result = {"error": str(e)}
+
+    return {
+        "id": item["id"],
+        "source": item.get("audio", "text"),
+        **result,
+        "timings": {stage: round(t, 4) for stage, t in timings.items()},
+        "elapsed": round(time.perf_counter() - started, 4)
+    }
+
+
+async def run_batch(items, args):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    stage_totals = {}
+    stage_counts = {}
+    completed = 0
+    failed = 0
+
+    with open(args.output, "a+", encoding="utf-8") as out:
+        # Terminate a line cut off by an interrupted run so the next record starts cleanly
+        if out.tell() > 0:
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+
+        async def worker(item):
+            nonlocal completed, failed
+            async with semaphore:
+                record = await process_item(item, args)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            completed += 1
+            if "error" in record:
+                failed += 1
+            for stage, t in record["timings"].items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + t
+                stage_counts[stage] = stage_counts.get(stage, 0) + 1
+            print(f"✅ [{completed}/{len(items)}] {item['id']} ({record['elapsed']}s)")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(item) for item in items))
+        wall = time.perf_counter() - started
+
+    return {
+        "items": completed,
+        "failed": failed,
+        "wall_seconds": round(wall, 3),
+        "items_per_second": round(completed / wall, 3) if wall > 0 else None,
+        "concurrency": args.concurrency,
+        "stage_seconds_total": {s: round(t, 3) for s, t in stage_totals.items()},
+        # Mean over the items that ran the stage (e.g. speech_to_text only for audio items)
+        "stage_seconds_mean": {s: round(t / stage_counts[s], 4) for s, t in stage_totals.items()}
+    }
+
+
+def write_parquet(jsonl_path: str, parquet_path: str):
+    import pandas as pd
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        records = []
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    latest = {record["id"]: record for record in records}  # a retried item's newest record wins
+    df = pd.json_normalize(list(latest.values()))
+    try:
+        df.to_parquet(parquet_path, index=False)
+        print(f"📦 Parquet written to {parquet_path}")
+    except ImportError as e:
+        print(f"⚠️ Could not write Parquet ({e}). Install pyarrow to enable it.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-process FarmWise voice notes and text queries.")
+    parser.add_argument("input", help="Directory of audio/.txt files or a JSONL manifest")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL results file (also the checkpoint)")
+    parser.add_argument("--parquet", help="Also write all results to this Parquet file")
+    parser.add_argument("--concurrency", type=positive_int, default=4, help="Items processed at the same time")
+    parser.add_argument("--lang", help="Default language for items without one (en, yo, ha, sw, twi)")
+    parser.add_argument("--user-id", help="Remember items without their own user_id under this id "
+                                          "(default: items are not added to conversation memory)")
+    parser.add_argument("--llm-timeout", type=float, default=120,
+                        help="Seconds to wait for the LLM before using the local fallback answer")
+    parser.add_argument("--no-tts", action="store_true", help="Skip text-to-speech generation")
+    args = parser.parse_args()
+
+    items = load_items(args.input)
+    done = load_checkpoint(args.output)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"📋 {len(items)} items, {len(done)} already done, {len(pending)} to process.")
+
+    report = asyncio.run(run_batch(pending, args))
+
+    report_path = os.path.splitext(args.output)[0] + ".report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.parquet:
+        write_parquet(args.output, args.parquet)
+
+
+if __name__ == "__main__":
+    main()
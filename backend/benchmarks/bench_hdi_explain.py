@@ -0,0 +1,86 @@
+"""
+Benchmark: per-row cost of HDI prediction explanations at batch sizes 1 .. 10k.
+
+Uses backend/models/hdi_classifier.pkl when it exists, otherwise a synthetic
+RandomForest with the same 8 input features and 200 trees as the notebook.
+
+    python benchmarks/bench_hdi_explain.py [--model path] [--sizes 1 10 100 1000 10000]
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from utils.hdi_explainer import ForestExplainer
+
+FEATURES = [
+    "GNI_per_capita",
+    "Expected_years_schooling_male",
+    "Expected_years_schooling_female",
+    "HDI_male",
+    "HDI_female",
+    "Estimated_GNI_male",
+    "Estimated_GNI_female",
+    "Adult_population"
+]
+DEFAULT_MODEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "hdi_classifier.pkl")
+
+
+def synthetic_rows(n: int, rng) -> pd.DataFrame:
+    return pd.DataFrame(rng.lognormal(mean=1.0, sigma=1.0, size=(n, len(FEATURES))), columns=FEATURES)
+
+
+def synthetic_model(rng):
+    X = synthetic_rows(2000, rng)
+    score = np.log(X["GNI_per_capita"]) + X["HDI_female"] / X["HDI_female"].max()
+    y = pd.qcut(score, 4, labels=["Low", "Medium", "High", "Very High"]).astype(str)
+    return RandomForestClassifier(n_estimators=200, random_state=42, n_jobs=-1).fit(X, y)
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if os.path.exists(args.model):
+        model = joblib.load(args.model)
+        print(f"Model: {args.model}")
+    else:
+        model = synthetic_model(rng)
+        print("Model: synthetic RandomForest (200 trees)")
+
+    start = time.perf_counter()
+    explainer = ForestExplainer(model, feature_names=FEATURES)
+    print(f"Explainer build: {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"{explainer.node_matrix.shape[0]} nodes\n")
+
+    print(f"{'rows':>7} {'predict ms/row':>15} {'explain ms/row':>15} {'cached ms/row':>14}")
+    for n in args.sizes:
+        X = synthetic_rows(n, rng)
+        repeat = 5 if n <= 1000 else 2
+        t_predict = timed(lambda: model.predict_proba(X), repeat)
+        t_explain = timed(lambda: explainer.explain(X, use_cache=False), repeat)
+        explainer.explain(X)  # warm the cache
+        t_cached = timed(lambda: explainer.explain(X), repeat)
+        print(f"{n:>7} {t_predict / n * 1000:>15.4f} {t_explain / n * 1000:>15.4f} {t_cached / n * 1000:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
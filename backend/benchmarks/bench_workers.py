@@ -0,0 +1,123 @@
+"""
+Benchmark: request throughput vs. number of gunicorn workers.
+
+Starts the app with gunicorn.conf.py for each worker count, drives it with
+several client processes for a fixed duration and reports requests/second and
+scaling efficiency relative to one worker.
+
+    python benchmarks/bench_workers.py [--workers 1 2 4] [--path /] [--json '{...}']
+                                       [--duration 10] [--clients 4] [--concurrency 32]
+
+Pick a path that does not call external APIs (e.g. "/" or /predict_hdi_batch/
+with a model present) so the numbers measure this server, not Groq or Edge-TTS.
+"""
+import sys, os
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import signal
+import subprocess
+import tempfile
+import time
+
+import httpx
+
+
+async def _drive(url: str, body, duration: float, concurrency: int):
+    done = 0
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def loop():
+            nonlocal done, errors
+            while time.perf_counter() < deadline:
+                try:
+                    if body is None:
+                        response = await client.get(url)
+                    else:
+                        response = await client.post(url, json=body)
+                    if response.status_code < 400:
+                        done += 1
+                    else:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return done, errors
+
+
+def _client_process(args):
+    return asyncio.run(_drive(*args))
+
+
+def wait_until_up(base_url: str, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("Server did not start in time")
+
+
+def run_level(n_workers: int, args) -> dict:
+    env = dict(os.environ, WEB_CONCURRENCY=str(n_workers), PORT=str(args.port),
+               STATE_DB=os.path.join(tempfile.mkdtemp(), "bench_state.db"))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_up(base_url)
+        body = json.loads(args.json) if args.json else None
+        job = (base_url + args.path, body, args.duration, args.concurrency)
+        with multiprocessing.Pool(args.clients) as pool:
+            _client_process((base_url + args.path, body, 1.0, 4))  # warm-up
+            results = pool.map(_client_process, [job] * args.clients)
+        workers = httpx.get(base_url + "/metrics/workers", timeout=5).json()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    done = sum(r[0] for r in results)
+    return {
+        "workers": n_workers,
+        "requests": done,
+        "errors": sum(r[1] for r in results),
+        "rps": done / args.duration,
+        "workers_reporting": workers.get("worker_count")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--json", help="JSON body; sends POST instead of GET")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=max(2, multiprocessing.cpu_count() // 2))
+    parser.add_argument("--concurrency", type=int, default=32, help="In-flight requests per client process")
+    parser.add_argument("--port", type=int, default=7870)
+    args = parser.parse_args()
+
+    print(f"CPU cores: {multiprocessing.cpu_count()}, path: {args.path}, "
+          f"{args.clients} clients x {args.concurrency} in flight\n")
+    print(f"{'workers':>7} {'req/s':>10} {'speedup':>8} {'efficiency':>10} {'errors':>7}")
+    baseline = None
+    for n in args.workers:
+        result = run_level(n, args)
+        baseline = baseline or result["rps"] / n
+        speedup = result["rps"] / baseline if baseline else 0.0
+        print(f"{n:>7} {result['rps']:>10.1f} {speedup:>8.2f} {speedup / n:>10.0%} {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# gunicorn.conf.py
+# Multi-worker serving: gunicorn -c gunicorn.conf.py main:app
+#
+# The app is imported once in the master (preload_app) so the HDI model, TF-IDF
+# vectorizer and other read-only artifacts are shared copy-on-write by all forked
+# workers. Conversation memory, the late-answer cache and worker metrics go through
+# the SQLite shared store whenever more than one worker runs.
+#
+# Behind a reverse proxy, set TRUSTED_PROXIES (see utils/admission_control.py) to the
+# proxy's IP(s) so per-IP rate limits see real client addresses.
+import gc
+import os
+
+# Without WEB_CONCURRENCY, stay conservative: each worker holds its own copy of
+# whatever is not shared, and the work is mostly waiting on Groq and Edge-TTS.
+MAX_DEFAULT_WORKERS = 4
+
+
+def available_cpus() -> int:
+    """CPUs this process may actually run on: affinity mask and cgroup v2 quota, not host cores."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '7860')}"
+workers = int(os.getenv("WEB_CONCURRENCY", min(available_cpus(), MAX_DEFAULT_WORKERS)))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+
+# Must be set before the app is preloaded so every module picks the shared backend
+# and the admission controller can split its in-flight cap between the workers.
+os.environ.setdefault("STATE_BACKEND", "sqlite" if workers > 1 else "local")
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+
+def when_ready(server):
+    # Build lazily-created read-only state in the master so workers inherit it.
+    import main
+    from utils.memory_manager import import_json_memory
+    main.get_hdi_explainer()
+    import_json_memory()
+    # Move everything allocated so far out of the GC's reach: collections in the workers
+    # would otherwise touch (and copy) every shared page.
+    gc.freeze()
+    server.log.info(f"Preloaded app, {gc.get_freeze_count()} objects frozen, starting {workers} workers")
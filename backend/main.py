@@ -1,19 +1,30 @@
 import sys, os
+import asyncio
+import hmac
+import json
+import time
+from contextlib import contextmanager
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from fastapi import FastAPI, UploadFile, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, Form, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, FileResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from fastapi.staticfiles import StaticFiles
-from utils.intent_response import get_intent_response
-from utils.speech_to_text import convert_speech_to_text
+from utils.intent_response import get_intent_response, LLM_MAX_WORKERS
+from utils.speech_to_text import convert_speech_to_text, transcribe_audio_bytes
 from utils.text_to_speech import convert_text_to_speech
 from utils.language_utils import detect_language
 from utils.intent_classifier import classify_intent
 from utils.data_model import get_personalized_response
 from utils.memory_manager import remember_message, get_conversation_context
 from utils.logger import log_interaction
+from utils.admission_control import AdmissionController, AdmissionRejected, combine_stats, resolve_client_ip
+from utils.voice_session import VoiceSession, pcm_to_wav
+from utils import profiler
+from utils.hdi_explainer import ForestExplainer
+from utils.shared_store import get_store
+from utils.worker_metrics import WorkerMetrics
 import joblib
 import pickle
 import pandas as pd
@@ -159,35 +170,147 @@ def get_tip_nlp(user_input: str, lang: str) -> str:
         return random.choice(TIPS["general"]["english"])
 
 
+# --- Latency deadline & local fallback answers ---
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "6"))
+LATE_RESPONSE_CACHE_SIZE = int(os.getenv("LATE_RESPONSE_CACHE_SIZE", "500"))
+# While this many LLM calls are still running past their deadline, upstream is treated as
+# degraded and new requests are answered locally without starting another call.
+MAX_LATE_TASKS = int(os.getenv("MAX_LATE_TASKS", str(LLM_MAX_WORKERS)))
+
+INTENT_TOPICS = {
+    "loan_inquiry": "credit",
+    "market_info": "investment",
+    "crop_advice": "general",
+    "weather_update": "general",
+    "general": "general"
+}
+
+# Late LLM answers, keyed by user + language + normalized question, reused when the same
+# user repeats the question (shared between workers when STATE_BACKEND=sqlite)
+late_responses = get_store("late_responses", max_entries=LATE_RESPONSE_CACHE_SIZE)
+
+# Strong references to LLM tasks still running after their deadline
+late_tasks = set()
+
+
+def client_deadline(deadline_ms: Optional[int]) -> Optional[float]:
+    """Deadline (seconds) asked for by a client, clamped to [0, LLM_DEADLINE_SECONDS]."""
+    if deadline_ms is None:
+        return None
+    return min(max(deadline_ms / 1000, 0.0), LLM_DEADLINE_SECONDS)
+
+
+def _late_response_key(user_id: str, user_text: str, lang: str) -> str:
+    return f"{user_id}|{normalize_language(lang)}|{' '.join(user_text.lower().split())}"
+
+
+def build_local_answer(user_text: str, intent: str, lang: str) -> str:
+    """Build an instant answer from the intent and the multilingual tips corpus (no LLM call)."""
+    normalized_lang = normalize_language(lang)
+    topic_tips = TIPS.get(INTENT_TOPICS.get(intent, "general"), TIPS["general"])
+    tips = topic_tips.get(normalized_lang, topic_tips["english"])
+    answer = tips[0]
+    nlp_tip = get_tip_nlp(user_text, lang=normalized_lang)
+    if nlp_tip != answer:
+        answer = f"{answer} {nlp_tip}"
+    return answer
+
+
+def _store_late_response(key, task: asyncio.Task):
+    """Cache an LLM answer that arrived after the deadline so the next identical question gets it."""
+    if task.cancelled() or task.exception() is not None or task.result() is None:
+        return
+    late_responses.set(key, task.result())
+
+
+async def get_response_within_deadline(user_text: str, intent: str, context=None,
+                                       response_lang: str = "english",
+                                       deadline: Optional[float] = None, user_id: str = "guest"):
+    """
+    Ask the LLM but never wait longer than the deadline (seconds).
+    Returns (response_text, source) where source is "llm", "cache" or "local_fallback".
+    """
+    key = _late_response_key(user_id, user_text, response_lang)
+    cached = late_responses.pop(key)
+    if cached is not None:
+        return cached, "cache"
+
+    if len(late_tasks) >= MAX_LATE_TASKS:
+        print(f"⏱️ {len(late_tasks)} LLM calls still overdue, answering locally.")
+        return build_local_answer(user_text, intent, response_lang), "local_fallback"
+
+    deadline = LLM_DEADLINE_SECONDS if deadline is None else deadline
+    task = asyncio.create_task(
+        get_intent_response(user_text, context=context, response_language=response_lang)
+    )
+    done, _ = await asyncio.wait({task}, timeout=deadline)
+    if task in done:
+        response = task.result()
+        if response is not None:
+            return response, "llm"
+        print("⚠️ LLM call failed, answering locally.")
+        return build_local_answer(user_text, intent, response_lang), "local_fallback"
+
+    print(f"⏱️ LLM exceeded {deadline}s deadline, answering locally.")
+    late_tasks.add(task)
+    task.add_done_callback(late_tasks.discard)
+    task.add_done_callback(lambda t: _store_late_response(key, t))
+    return build_local_answer(user_text, intent, response_lang), "local_fallback"
+
+
 # --- Core Message Processor ---
-async def process_message(user_text: str, user_id: str = "guest", lang_hint: Optional[str] = None):
+@contextmanager
+def timed_stage(timings: Optional[dict], stage: str):
+    """Accumulate wall time for a pipeline stage into `timings` (no-op when None)."""
+    start = time.perf_counter()
     try:
-        if lang_hint:
-            response_lang = normalize_language(lang_hint)
-            detected_language = response_lang
-        else:
-            detected_language = detect_language(user_text)
-            response_lang = normalize_language(detected_language)
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
 
-        intent = classify_intent(user_text)
-        context = get_conversation_context(user_id)
 
-        response_text = await get_intent_response(user_text, context=context, response_language=response_lang)
+async def process_message(user_text: str, user_id: str = "guest", lang_hint: Optional[str] = None,
+                          deadline: Optional[float] = None, context=None,
+                          tts: bool = True, timings: Optional[dict] = None, remember: bool = True):
+    try:
+        with timed_stage(timings, "language"):
+            if lang_hint:
+                response_lang = normalize_language(lang_hint)
+                detected_language = response_lang
+            else:
+                detected_language = detect_language(user_text)
+                response_lang = normalize_language(detected_language)
+
+        with timed_stage(timings, "intent"):
+            intent = classify_intent(user_text)
+        if context is None:
+            context = get_conversation_context(user_id) if remember else []
+
+        with timed_stage(timings, "llm"):
+            response_text, response_source = await get_response_within_deadline(
+                user_text, intent, context=context, response_lang=response_lang,
+                deadline=deadline, user_id=user_id
+            )
         personalized_hint = get_personalized_response(intent, user_text)
         full_response = f"{response_text}\n\n{personalized_hint}"
 
-        remember_message(user_id, "user", user_text)
-        remember_message(user_id, "assistant", full_response)
+        if remember:
+            remember_message(user_id, "user", user_text)
+            remember_message(user_id, "assistant", full_response)
 
-        try:
-            audio_path = await convert_text_to_speech(full_response, lang=response_lang)
-            audio_url = f"audio_responses/{os.path.basename(audio_path)}" if audio_path else None
-        except Exception as tts_error:
-            print(f"⚠️ TTS generation failed: {tts_error}")
-            audio_url = None
+        audio_url = None
+        if tts:
+            with timed_stage(timings, "tts"):
+                try:
+                    audio_path = await convert_text_to_speech(full_response, lang=response_lang)
+                    audio_url = f"audio_responses/{os.path.basename(audio_path)}" if audio_path else None
+                except Exception as tts_error:
+                    print(f"⚠️ TTS generation failed: {tts_error}")
 
         log_interaction(user_text, full_response, language=response_lang, intent=intent)
-        tip = get_tip_nlp(user_text, lang=response_lang)
+        with timed_stage(timings, "tip"):
+            tip = get_tip_nlp(user_text, lang=response_lang)
 
         return {
             "detected_language": detected_language,
@@ -195,7 +318,8 @@ async def process_message(user_text: str, user_id: str = "guest", lang_hint: Opt
             "user_text": user_text,
             "ai_response": full_response,
             "tip": tip,
-            "audio_url": audio_url
+            "audio_url": audio_url,
+            "response_source": response_source
         }
 
     except Exception as e:
@@ -203,14 +327,130 @@ async def process_message(user_text: str, user_id: str = "guest", lang_hint: Opt
         return {"error": str(e)}
 
 
+# --- Admission control ---
+admission = AdmissionController()
+
+
+def rejected_response(e: AdmissionRejected):
+    return JSONResponse(
+        status_code=e.status_code,
+        content={"detail": e.detail},
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def client_ip(request: Request) -> Optional[str]:
+    peer = request.client.host if request.client else None
+    return resolve_client_ip(peer, request.headers.get("x-forwarded-for"))
+
+
+# --- Per-worker and aggregate request metrics ---
+worker_metrics = WorkerMetrics(sections={"admission": (admission.stats, combine_stats)})
+
+
+background_tasks = set()  # strong references, so the event loop does not drop them
+
+
+@app.on_event("startup")
+async def start_metrics_publisher():
+    # Runs in every worker; keeps this worker's snapshot (and admission stats) fresh while idle.
+    task = asyncio.create_task(worker_metrics.publish_forever())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        worker_metrics.record(request.url.path, status_code, time.perf_counter() - started)
+
+
+@app.get("/metrics/workers")
+def workers_metrics():
+    return worker_metrics.aggregate()
+
+
+@app.get("/metrics/admission")
+def admission_metrics():
+    # Summed over all workers; per-worker numbers are under /metrics/workers.
+    return worker_metrics.combine("admission")
+
+
+# --- Opt-in request profiling ---
+# Enabled with PROFILING_ENABLED=1; otherwise no middleware or routes are installed.
+if profiler.PROFILING_ENABLED:
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+    def is_admin(request: Request) -> bool:
+        # Fail closed: without a configured ADMIN_TOKEN nobody is an admin.
+        token = request.headers.get("x-admin-token")
+        # Compare bytes: compare_digest rejects non-ASCII str, and any client controls this header.
+        # Starlette decodes header values as latin-1, so that recovers the raw bytes sent.
+        return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(
+            token.encode("latin-1"), ADMIN_TOKEN.encode("utf-8")
+        )
+
+    @app.middleware("http")
+    async def profile_requests(request: Request, call_next):
+        if not profiler.should_profile(request.headers, allow_header=is_admin(request)):
+            return await call_next(request)
+        request_profiler = profiler.RequestProfiler(f"{request.method}{request.url.path}")
+        if not request_profiler.start():
+            return await call_next(request)  # another request is already being profiled
+        try:
+            response = await call_next(request)
+        finally:
+            profile_name = request_profiler.stop()
+        response.headers["X-Profile-Id"] = profile_name
+        return response
+
+    @app.get("/admin/profiles")
+    def list_profiles(request: Request):
+        if not is_admin(request):
+            return JSONResponse(status_code=403, content={"detail": "Forbidden"})
+        return {"profiles": profiler.list_profiles()}
+
+    @app.get("/admin/profiles/{filename}")
+    def download_profile(filename: str, request: Request):
+        if not is_admin(request):
+            return JSONResponse(status_code=403, content={"detail": "Forbidden"})
+        path = profiler.profile_path(filename)
+        if path is None:
+            return JSONResponse(status_code=404, content={"detail": "Profile not found"})
+        return FileResponse(path, filename=filename)
+
+
 # --- Voice Chat Endpoint ---
 @app.post("/voice_chat/")
 async def full_voice_chat(
+    request: Request,
     file: Optional[UploadFile] = None,
     user_id: str = Form("guest"),
     text_override: Optional[str] = Form(None),
-    lang: Optional[str] = Form(None)
+    lang: Optional[str] = Form(None),
+    deadline_ms: Optional[int] = Form(None)
 ):
+    if not text_override and not file:
+        return JSONResponse(
+            status_code=400,
+            content={"detail": "No input provided. Provide text_override or file."}
+        )
+
+    kind = "text" if text_override else "voice"
+    try:
+        async with admission.admit(user_id, client_ip(request), kind=kind):
+            return await _voice_chat(file, user_id, text_override, lang, deadline_ms)
+    except AdmissionRejected as e:
+        return rejected_response(e)
+
+
+async def _voice_chat(file, user_id, text_override, lang, deadline_ms):
     user_text = None
 
     if text_override:
@@ -226,13 +466,9 @@ async def full_voice_chat(
         except Exception as e:
             print(f"❌ Transcription failed: {e}")
             user_text = "Error transcribing speech"
-    else:
-        return JSONResponse(
-            status_code=400,
-            content={"detail": "No input provided. Provide text_override or file."}
-        )
 
-    result = await process_message(user_text, user_id=user_id, lang_hint=lang)
+    deadline = client_deadline(deadline_ms)
+    result = await process_message(user_text, user_id=user_id, lang_hint=lang, deadline=deadline)
     return result
 
 
@@ -241,16 +477,113 @@ class ChatRequest(BaseModel):
     user_id: Optional[str] = "guest"
     text: str
     lang: Optional[str] = None
+    deadline_ms: Optional[int] = None
 
 
 @app.post("/chat/")
-async def chat_text(req: ChatRequest):
+async def chat_text(req: ChatRequest, request: Request):
     if not req.text:
         return JSONResponse(status_code=400, content={"detail": "No text provided."})
-    result = await process_message(req.text, user_id=req.user_id or "guest", lang_hint=req.lang)
+    user_id = req.user_id or "guest"
+    deadline = client_deadline(req.deadline_ms)
+    try:
+        async with admission.admit(user_id, client_ip(request), kind="text"):
+            result = await process_message(req.text, user_id=user_id, lang_hint=req.lang,
+                                           deadline=deadline)
+    except AdmissionRejected as e:
+        return rejected_response(e)
     return result
 
 
+# --- Streaming Voice Session (WebSocket) ---
+# Client sends binary frames of 16-bit mono PCM (16 kHz) and optional JSON control messages:
+#   {"type": "config", "lang": "yo"}   change the session language
+#   {"type": "end_utterance"}          finish the current turn without waiting for a pause
+# Server sends {"type": "transcript", ...} per segment and {"type": "response", ...} per turn.
+@app.websocket("/ws/voice_session")
+async def voice_session(websocket: WebSocket, user_id: str = "guest", lang: Optional[str] = None):
+    await websocket.accept()
+    ip = resolve_client_ip(websocket.client.host if websocket.client else None,
+                           websocket.headers.get("x-forwarded-for"))
+    try:
+        admission.check_rate(user_id, ip)  # opening a session spends a token like a request
+    except AdmissionRejected as e:
+        await websocket.send_json({
+            "type": "error", "status": e.status_code, "detail": e.detail, "retry_after": e.retry_after
+        })
+        await websocket.close(code=1013)
+        return
+    session = VoiceSession(user_id=user_id, lang=lang, context=get_conversation_context(user_id))
+
+    async def send_error(status: int, detail: str, retry_after: int = 1):
+        await websocket.send_json({"type": "error", "status": status, "detail": detail, "retry_after": retry_after})
+
+    async def transcribe_segment(pcm: bytes) -> str:
+        iso_lang = ISO_MAP.get(normalize_language(session.lang), "en") if session.lang else None
+        try:
+            # Each segment holds a voice slot while Whisper runs; its rate is bounded per session.
+            async with admission.admit(session.user_id, ip, kind="voice", rate_limited=False):
+                text = await transcribe_audio_bytes(pcm_to_wav(pcm), language=iso_lang)
+        except AdmissionRejected as e:
+            await send_error(e.status_code, e.detail, e.retry_after)
+            return ""
+        await websocket.send_json({"type": "transcript", "text": text})
+        return text
+
+    async def finish_utterance(tasks, previous_turn):
+        if previous_turn is not None:
+            await asyncio.gather(previous_turn, return_exceptions=True)  # keep turns in order
+        user_text = await session.collect_utterance(tasks)
+        if not user_text:
+            return
+        try:
+            async with admission.admit(session.user_id, ip, kind="voice"):
+                result = await process_message(
+                    user_text, user_id=session.user_id, lang_hint=session.lang, context=session.context
+                )
+        except AdmissionRejected as e:
+            await send_error(e.status_code, e.detail, e.retry_after)
+            return
+        if "ai_response" in result:
+            session.remember_turn(user_text, result["ai_response"])
+        await websocket.send_json({"type": "response", **result})
+
+    async def handle(events):
+        for event, pcm in events:
+            if event == "segment":
+                rejection = session.segment_rejection()
+                if rejection:
+                    await send_error(429, rejection)
+                    continue
+                session.add_segment(asyncio.create_task(transcribe_segment(pcm)))
+            elif event == "utterance_end":
+                # Run the turn in the background so incoming audio keeps being segmented.
+                session.turn_task = asyncio.create_task(
+                    finish_utterance(session.take_utterance(), session.turn_task)
+                )
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                await handle(session.segmenter.feed(message["bytes"]))
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    continue
+                if control.get("type") == "config":
+                    session.lang = control.get("lang", session.lang)
+                elif control.get("type") == "end_utterance":
+                    await handle(session.segmenter.flush())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.cancel()
+
+
 # --- HDI CATEGORY PREDICTION MODEL INTEGRATION ---
 model_path = os.path.join(os.path.dirname(__file__), "models", "hdi_classifier.pkl")
 
@@ -292,10 +625,59 @@ class HDIInput(BaseModel):
     Adult_population: float
 
 
+hdi_explainer = None
+
+
+def get_hdi_explainer():
+    """Build the tree-path explainer on first use (None if the model is not a tree ensemble)."""
+    global hdi_explainer
+    if hdi_explainer is None and hdi_model is not None:
+        try:
+            hdi_explainer = ForestExplainer(hdi_model, feature_names=EXPECTED_FEATURES)
+        except Exception as e:
+            print(f"⚠️ HDI explanations unavailable: {e}")
+            hdi_explainer = False
+    return hdi_explainer or None
+
+
+def predict_hdi_frame(input_df: pd.DataFrame, explain: bool = False, top_k: Optional[int] = None):
+    """Shared single/batch prediction: one vectorized predict_proba (and explanation) call."""
+    probas = hdi_model.predict_proba(input_df)
+    classes = hdi_model.classes_
+    predictions = classes[probas.argmax(axis=1)]
+    results = [
+        {"prediction": prediction.item() if hasattr(prediction, "item") else prediction,
+         "confidence": round(float(proba.max()), 3)}
+        for prediction, proba in zip(predictions, probas)
+    ]
+    if explain:
+        explainer = get_hdi_explainer()
+        if explainer is None:
+            raise ValueError("Explanations are only supported for tree-ensemble HDI models.")
+        for result, explanation in zip(results, explainer.explain_records(input_df, predictions, top_k=top_k)):
+            result["explanation"] = explanation
+    return results
+
+
+def invalid_explain_params(explain: bool, top_k: Optional[int]):
+    """400 response for unusable explanation parameters, or None when they are fine."""
+    if top_k is not None and top_k < 1:
+        return JSONResponse(status_code=400, content={"error": "top_k must be at least 1."})
+    if explain and get_hdi_explainer() is None:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Explanations are only supported for tree-ensemble HDI models."}
+        )
+    return None
+
+
 @app.post("/predict_hdi/")
-async def predict_hdi(data: HDIInput):
+async def predict_hdi(data: HDIInput, explain: bool = False, top_k: Optional[int] = None):
     if hdi_model is None:
         return JSONResponse(status_code=500, content={"error": "HDI model not loaded."})
+    invalid = invalid_explain_params(explain, top_k)
+    if invalid is not None:
+        return invalid
     try:
         input_df = pd.DataFrame([data.dict()])
         missing = [col for col in EXPECTED_FEATURES if col not in input_df.columns]
@@ -304,12 +686,33 @@ async def predict_hdi(data: HDIInput):
                 status_code=400,
                 content={"error": f"Missing required features: {missing}"}
             )
-        prediction = hdi_model.predict(input_df)[0]
-        proba = hdi_model.predict_proba(input_df).max()
+        result = predict_hdi_frame(input_df, explain=explain, top_k=top_k)[0]
+        return {
+            **result,
+            "features_used": EXPECTED_FEATURES
+        }
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+class HDIBatchInput(BaseModel):
+    rows: List[HDIInput]
+
+
+@app.post("/predict_hdi_batch/")
+async def predict_hdi_batch(data: HDIBatchInput, explain: bool = False, top_k: Optional[int] = None):
+    if hdi_model is None:
+        return JSONResponse(status_code=500, content={"error": "HDI model not loaded."})
+    if not data.rows:
+        return JSONResponse(status_code=400, content={"error": "No rows provided."})
+    invalid = invalid_explain_params(explain, top_k)
+    if invalid is not None:
+        return invalid
+    try:
+        input_df = pd.DataFrame([row.dict() for row in data.rows])[EXPECTED_FEATURES]
         return {
-            "prediction": prediction,
-            "confidence": round(float(proba), 3),
+            "predictions": predict_hdi_frame(input_df, explain=explain, top_k=top_k),
             "features_used": EXPECTED_FEATURES
         }
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": str(e)})
\ No newline at end of file
+        return JSONResponse(status_code=500, content={"error": str(e)})
@@ -0,0 +1,218 @@
+# admission_control.py
+import os
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from utils.shared_store import get_store
+
+# Per-user token bucket (requests/second and burst size)
+RATE_PER_SECOND = float(os.getenv("ADMISSION_RATE_PER_SECOND", "0.5"))
+BURST = float(os.getenv("ADMISSION_BURST", "5"))
+
+# Per-IP token bucket. Much looser than the per-user one: many users can share an address
+# (NAT, mobile carriers, the Streamlit frontend calling from its own server), so it only
+# stops a single host from flooding the service.
+IP_RATE_PER_SECOND = float(os.getenv("ADMISSION_IP_RATE_PER_SECOND", "5"))
+IP_BURST = float(os.getenv("ADMISSION_IP_BURST", "30"))
+
+# Global concurrency: voice turns (Whisper + LLM + TTS) may only use part of the slots,
+# so text chats always have headroom. The cap is for the whole server: each of the
+# WEB_CONCURRENCY workers gets an equal share of it.
+MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "16"))
+WORKER_COUNT = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+VOICE_SHARE = float(os.getenv("ADMISSION_VOICE_SHARE", "0.5"))
+
+# Requests that would queue longer than this are shed with 503 instead of waiting.
+QUEUE_SLO_SECONDS = float(os.getenv("ADMISSION_QUEUE_SLO_SECONDS", "2"))
+
+MAX_TRACKED_CLIENTS = 10000
+
+# Reverse proxies whose X-Forwarded-For header is believed (comma-separated IPs), e.g. the
+# hosting platform's load balancer. From anyone else the header is ignored, since clients
+# could rotate it to dodge rate limits. Left empty behind a proxy, every client shares the
+# proxy's IP bucket.
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed. Carries the HTTP status and a Retry-After hint."""
+
+    def __init__(self, status_code: int, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.detail = detail
+
+
+class TokenBucket:
+    # Wall-clock time, so a bucket's state stays meaningful when another worker loads it.
+    def __init__(self, rate: float, capacity: float, tokens: float = None, updated: float = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = time.time() if updated is None else updated
+
+    def take(self) -> float:
+        """Take one token. Returns 0 on success, otherwise seconds until a token is available."""
+        now = max(time.time(), self.updated)
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class AdmissionController:
+    """
+    Admission control in front of the chat pipeline:
+    - token-bucket rate limit per user_id and (looser) per client IP (429), with the buckets in the
+      shared store so all workers spend from the same ones,
+    - in-flight cap (this worker's share of the global one) with a smaller share for voice,
+    - queueing bounded by a latency SLO (503 once the expected wait exceeds it).
+    """
+
+    def __init__(self, rate=RATE_PER_SECOND, burst=BURST, max_in_flight=MAX_IN_FLIGHT,
+                 voice_share=VOICE_SHARE, queue_slo=QUEUE_SLO_SECONDS, workers=WORKER_COUNT,
+                 ip_rate=IP_RATE_PER_SECOND, ip_burst=IP_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.max_in_flight = max(1, max_in_flight // workers)
+        self.voice_limit = max(1, int(self.max_in_flight * voice_share))
+        self.queue_slo = queue_slo
+        # Least recently seen clients are evicted first
+        self.buckets = get_store("rate_buckets", max_entries=MAX_TRACKED_CLIENTS)
+        self.in_flight = {"text": 0, "voice": 0}
+        self.waiting = {"text": 0, "voice": 0}
+        self.avg_service_time = 1.0
+        self.condition = asyncio.Condition()
+        self.counters = {
+            "admitted": 0,
+            "rate_limited": 0,
+            "shed": 0,
+            "completed": 0
+        }
+
+    def _take(self, key: str, rate: float, burst: float) -> float:
+        """Take a token from the shared bucket at `key`; returns TokenBucket.take()'s wait."""
+        wait = 0.0
+
+        def spend(state):
+            nonlocal wait
+            bucket = TokenBucket(rate, burst, *(state or ()))
+            wait = bucket.take()
+            return [bucket.tokens, bucket.updated]
+
+        self.buckets.update(key, spend)
+        return wait
+
+    def _has_slot(self, kind: str) -> bool:
+        total = self.in_flight["text"] + self.in_flight["voice"]
+        if total >= self.max_in_flight:
+            return False
+        if kind == "voice":
+            # Queued text requests get freed slots first.
+            return self.in_flight["voice"] < self.voice_limit and self.waiting["text"] == 0
+        return True
+
+    def _expected_wait(self, kind: str) -> float:
+        # Text requests only queue behind other text; voice queues behind everything.
+        ahead = self.waiting["text"] + (self.waiting["voice"] if kind == "voice" else 0)
+        slots = self.voice_limit if kind == "voice" else self.max_in_flight
+        return (ahead + 1) * self.avg_service_time / slots
+
+    def check_rate(self, user_id: str, client_ip: str = None):
+        # Every request spends from its client IP's (looser) bucket, so rotating user_id values
+        # does not help; named users additionally get their own bucket ("guest" is anyone).
+        buckets = [(f"ip:{client_ip or 'unknown'}", self.ip_rate, self.ip_burst)]
+        if user_id and user_id != "guest":
+            buckets.append((f"user:{user_id}", self.rate, self.burst))
+        for key, rate, burst in buckets:
+            wait = self._take(key, rate, burst)
+            if wait > 0:
+                self.counters["rate_limited"] += 1
+                raise AdmissionRejected(429, wait, "Too many requests, please slow down.")
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, client_ip: str = None, kind: str = "text", rate_limited: bool = True):
+        """
+        Hold a pipeline slot for the duration of the block, or raise AdmissionRejected.
+        rate_limited=False skips the token buckets, for work whose rate is bounded elsewhere
+        (e.g. segments of an already admitted voice session).
+        """
+        if rate_limited:
+            self.check_rate(user_id, client_ip)
+
+        async with self.condition:
+            if not self._has_slot(kind):
+                expected = self._expected_wait(kind)
+                if expected > self.queue_slo:
+                    self.counters["shed"] += 1
+                    raise AdmissionRejected(503, expected, "Server is busy, please retry shortly.")
+                self.waiting[kind] += 1
+                try:
+                    await asyncio.wait_for(
+                        self.condition.wait_for(lambda: self._has_slot(kind)),
+                        timeout=self.queue_slo
+                    )
+                except asyncio.TimeoutError:
+                    self.counters["shed"] += 1
+                    raise AdmissionRejected(503, self.avg_service_time, "Server is busy, please retry shortly.")
+                finally:
+                    self.waiting[kind] -= 1
+                    # Voice waiters are gated on queued text; wake them when a text waiter leaves.
+                    self.condition.notify_all()
+            self.in_flight[kind] += 1
+            self.counters["admitted"] += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self.avg_service_time = 0.9 * self.avg_service_time + 0.1 * elapsed
+            async with self.condition:
+                self.in_flight[kind] -= 1
+                self.counters["completed"] += 1
+                self.condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "in_flight": dict(self.in_flight),
+            "waiting": dict(self.waiting),
+            "max_in_flight": self.max_in_flight,
+            "voice_limit": self.voice_limit,
+            "avg_service_time": round(self.avg_service_time, 3),
+            "tracked_clients": len(self.buckets)
+        }
+
+
+def combine_stats(per_worker: list) -> dict:
+    """Server-wide admission stats from each worker's stats()."""
+    if not per_worker:
+        return {}
+    combined = {key: sum(s[key] for s in per_worker)
+                for key in ("admitted", "rate_limited", "shed", "completed", "max_in_flight", "voice_limit")}
+    for key in ("in_flight", "waiting"):
+        combined[key] = {kind: sum(s[key].get(kind, 0) for s in per_worker) for kind in ("text", "voice")}
+    combined["avg_service_time"] = round(sum(s["avg_service_time"] for s in per_worker) / len(per_worker), 3)
+    # The buckets are shared, so every worker sees the same clients
+    combined["tracked_clients"] = max(s["tracked_clients"] for s in per_worker)
+    return combined
+
+
+def resolve_client_ip(peer_ip: str, forwarded_for: str = None) -> str:
+    """
+    Client IP for rate limiting. X-Forwarded-For is only used when the direct peer is a
+    trusted proxy; then the right-most address not belonging to a trusted proxy is taken.
+    """
+    if not forwarded_for or peer_ip not in TRUSTED_PROXIES:
+        return peer_ip
+    for hop in reversed([h.strip() for h in forwarded_for.split(",") if h.strip()]):
+        if hop not in TRUSTED_PROXIES:
+            return hop
+    return peer_ip
@@ -0,0 +1,148 @@
+# hdi_explainer.py
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+EXPLAIN_CACHE_SIZE = int(os.getenv("EXPLAIN_CACHE_SIZE", "10000"))
+
+
+class ForestExplainer:
+    """
+    Per-prediction feature contributions for a RandomForestClassifier (tree-path / Saabas method).
+
+    For every tree node we precompute how much the class probabilities change when the path
+    enters that node, attributed to the feature split on by its parent. Stacking all trees gives
+    one sparse (total_nodes x features*classes) matrix, so explaining any number of rows is a
+    single sparse product with the forest's decision-path indicator:
+
+        predict_proba(x) == base_value + contributions(x).sum(over features)
+
+    Works on a bare forest or on a Pipeline whose last step is the forest.
+    """
+
+    def __init__(self, model, feature_names=None, cache_size: int = EXPLAIN_CACHE_SIZE):
+        if hasattr(model, "steps"):
+            self.preprocessor = model[:-1]
+            self.forest = model.steps[-1][1]
+        else:
+            self.preprocessor = None
+            self.forest = model
+        if not hasattr(self.forest, "estimators_"):
+            raise TypeError("Explanations need a fitted tree ensemble (e.g. RandomForestClassifier).")
+
+        self.classes = list(self.forest.classes_)
+        self.n_classes = len(self.classes)
+        self.n_features = self.forest.n_features_in_
+        self.feature_names = self._resolve_feature_names(feature_names)
+        self.base_value, self.node_matrix = self._build_node_matrix()
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+    def _resolve_feature_names(self, feature_names):
+        if self.preprocessor is not None:
+            try:
+                return [str(n) for n in self.preprocessor.get_feature_names_out()]
+            except Exception:
+                pass
+        if feature_names is not None and len(feature_names) == self.n_features:
+            return list(feature_names)
+        return [f"x{i}" for i in range(self.n_features)]
+
+    def _build_node_matrix(self):
+        rows, cols, vals = [], [], []
+        base = np.zeros(self.n_classes)
+        offset = 0
+        for tree in self.forest.estimators_:
+            t = tree.tree_
+            value = t.value[:, 0, :].astype(float)
+            value /= value.sum(axis=1, keepdims=True)  # counts or fractions -> probabilities
+            base += value[0]
+
+            # Parent of every non-root node, and the feature the parent splits on
+            children = np.concatenate([t.children_left, t.children_right])
+            parents = np.concatenate([np.arange(t.node_count)] * 2)
+            mask = children >= 0
+            children, parents = children[mask], parents[mask]
+
+            delta = value[children] - value[parents]  # (n_edges, n_classes)
+            feature = t.feature[parents]
+            rows.append(np.repeat(children + offset, self.n_classes))
+            cols.append((feature[:, None] * self.n_classes + np.arange(self.n_classes)).ravel())
+            vals.append(delta.ravel())
+            offset += t.node_count
+
+        n_trees = len(self.forest.estimators_)
+        matrix = sparse.csr_matrix(
+            (np.concatenate(vals) / n_trees, (np.concatenate(rows), np.concatenate(cols))),
+            shape=(offset, self.n_features * self.n_classes)
+        )
+        return base / n_trees, matrix
+
+    def transform(self, X):
+        if self.preprocessor is not None:
+            X = self.preprocessor.transform(X)
+        if sparse.issparse(X):
+            X = X.toarray()
+        return np.asarray(X, dtype=np.float32)
+
+    def contributions(self, Xt: np.ndarray) -> np.ndarray:
+        """Contributions for already-transformed rows: (n_rows, n_features, n_classes)."""
+        if hasattr(self.forest, "feature_names_in_"):
+            Xt = pd.DataFrame(Xt, columns=self.forest.feature_names_in_)
+        indicator, _ = self.forest.decision_path(Xt)
+        contrib = (indicator @ self.node_matrix).toarray()
+        return contrib.reshape(len(Xt), self.n_features, self.n_classes)
+
+    def explain(self, X, use_cache: bool = True) -> np.ndarray:
+        """
+        Contributions for raw model input (DataFrame or array), computing each unique row once
+        and reusing cached results for rows seen before.
+        """
+        Xt = self.transform(X)
+        if not use_cache:
+            return self.contributions(Xt)
+
+        keys = [row.tobytes() for row in Xt]
+        fresh = {}
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in self.cache and key not in missing:
+                missing[key] = i
+        if missing:
+            computed = self.contributions(Xt[list(missing.values())])
+            fresh = dict(zip(missing, computed))
+
+        result = np.empty((len(Xt), self.n_features, self.n_classes))
+        for i, key in enumerate(keys):
+            if key in fresh:
+                result[i] = fresh[key]
+            else:
+                result[i] = self.cache[key]
+                self.cache.move_to_end(key)
+
+        self.cache.update(fresh)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    def explain_records(self, X, predictions, top_k: int = None):
+        """JSON-friendly explanations for the predicted class of each row (top_k >= 1 features, or all)."""
+        if top_k is not None and top_k < 1:
+            raise ValueError("top_k must be at least 1.")
+        contribs = self.explain(X)
+        records = []
+        for contrib, prediction in zip(contribs, predictions):
+            k = self.classes.index(prediction)
+            values = contrib[:, k]
+            order = np.argsort(-np.abs(values))
+            if top_k is not None:
+                order = order[:top_k]
+            records.append({
+                "class": prediction.item() if hasattr(prediction, "item") else prediction,
+                "base_value": round(float(self.base_value[k]), 4),
+                "contributions": {self.feature_names[j]: round(float(values[j]), 4) for j in order}
+            })
+        return records
@@ -1,6 +1,9 @@
 # intent_response.py
 from groq import Groq
 import os
+import asyncio
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,11 +11,16 @@ load_dotenv()
 # Initialize Groq client
 client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
-async def get_intent_response(message: str, context=None, response_language: str = "en") -> str:
+# Dedicated, bounded pool for LLM calls: calls that outlive their deadline keep running here
+# instead of filling the default executor that Whisper and other to_thread work share.
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "8"))
+llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="groq-llm")
+
+async def get_intent_response(message: str, context=None, response_language: str = "en") -> Optional[str]:
     """
     Generates AI response based on user message and conversation context using Groq model.
     Handles financial questions, farming queries, and casual conversation.
-    Always returns a safe string even if the API response is malformed.
+    Returns None if the API call fails or the response is malformed, so callers can fall back.
     """
 
     try:
@@ -46,12 +54,15 @@ async def get_intent_response(message: str, context=None, response_language: str
         # 🔹 Add the new user message
         context_messages.append({"role": "user", "content": message})
 
-        # 🔹 Send to Groq model
-        chat_completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=context_messages,
-            temperature=0.6,
-            max_tokens=500
+        # 🔹 Send to Groq model (off the event loop so callers can enforce a deadline)
+        chat_completion = await asyncio.get_running_loop().run_in_executor(
+            llm_executor,
+            lambda: client.chat.completions.create(
+                model="llama-3.1-8b-instant",
+                messages=context_messages,
+                temperature=0.6,
+                max_tokens=500
+            )
         )
 
         # 🔹 Safely extract response
@@ -66,9 +77,5 @@ async def get_intent_response(message: str, context=None, response_language: str
         return response_text.strip()
 
     except Exception as e:
-        # Fallback safe response
-        return (
-            "⚠️ An error occurred while generating a response.\n\n"
-            "💡 Tip: You can check local cooperative societies for lower-interest agricultural loans, "
-            "or just say hi to chat casually with FarmWise AI!"
-        )
+        print(f"⚠️ Groq request failed: {e}")
+        return None
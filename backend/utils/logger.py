@@ -10,11 +10,15 @@ def log_interaction(message, response, language="en", intent="unknown"):
     """
     Log each interaction for analytics and personalization.
     """
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = (
-            f"[{timestamp}] LANG: {language} | INTENT: {intent}\n"
-            f"User: {message}\n"
-            f"AI: {response}\n\n"
-        )
-        f.write(log_entry)
\ No newline at end of file
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    log_entry = (
+        f"[{timestamp}] LANG: {language} | INTENT: {intent}\n"
+        f"User: {message}\n"
+        f"AI: {response}\n\n"
+    )
+    # One O_APPEND write per entry so entries from several workers do not interleave
+    fd = os.open(LOG_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, log_entry.encode("utf-8"))
+    finally:
+        os.close(fd)
\ No newline at end of file
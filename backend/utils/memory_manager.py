@@ -1,9 +1,37 @@
 # memory_manager.py
 import json
 import os
+import time
+from utils.shared_store import STATE_BACKEND, get_store
 
 MEMORY_FILE = "conversation_memory.json"
 
+# With several workers the JSON file would be rewritten concurrently, so conversations
+# live in the shared SQLite store instead (STATE_BACKEND=sqlite).
+conversation_store = get_store("conversation") if STATE_BACKEND == "sqlite" else None
+json_imported = False
+
+def import_json_memory():
+    """
+    Copy conversations from MEMORY_FILE into the SQLite store, once per database, so switching
+    to STATE_BACKEND=sqlite keeps existing history. Imported turns go before any newer ones.
+    """
+    global json_imported
+    if conversation_store is None or json_imported:
+        return
+    json_imported = True
+    if not os.path.exists(MEMORY_FILE):
+        return
+    # Exactly one process (across workers and restarts) wins the claim and does the import.
+    claim = f"{os.getpid()}:{time.time()}"
+    migrations = get_store("migrations")
+    if migrations.setdefault(f"import:{os.path.abspath(MEMORY_FILE)}", claim) != claim:
+        return
+    memory = load_memory()
+    for user_id, messages in memory.items():
+        conversation_store.update(user_id, lambda existing: messages + existing, default=[])
+    print(f"📥 Imported {len(memory)} conversations from {MEMORY_FILE} into the shared store.")
+
 def load_memory():
     if not os.path.exists(MEMORY_FILE):
         return {}
@@ -15,6 +43,10 @@ def save_memory(memory):
         json.dump(memory, f, ensure_ascii=False, indent=2)
 
 def remember_message(user_id, role, message):
+    if conversation_store is not None:
+        import_json_memory()
+        conversation_store.append(user_id, {"role": role, "message": message})
+        return
     memory = load_memory()
     if user_id not in memory:
         memory[user_id] = []
@@ -22,10 +54,17 @@ def remember_message(user_id, role, message):
     save_memory(memory)
 
 def get_conversation_context(user_id):
+    if conversation_store is not None:
+        import_json_memory()
+        return conversation_store.get(user_id, [])
     memory = load_memory()
     return memory.get(user_id, [])
 
 def clear_user_memory(user_id):
+    if conversation_store is not None:
+        import_json_memory()
+        conversation_store.pop(user_id)
+        return
     memory = load_memory()
     if user_id in memory:
         del memory[user_id]
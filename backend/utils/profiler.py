@@ -0,0 +1,128 @@
+# profiler.py
+import os
+import re
+import sys
+import time
+import uuid
+import random
+import cProfile
+import threading
+from collections import Counter
+
+# Profiling is opt-in: nothing is installed unless PROFILING_ENABLED=1.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER = "x-profile"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("logs", "profiles"))
+MAX_PROFILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+PROFILE_NAME_RE = re.compile(r"^[\w\-.]+\.(prof|folded)$")
+
+# cProfile allows one active profiler per thread, so one request is profiled at a time.
+_profile_lock = threading.Lock()
+
+
+def should_profile(headers, allow_header: bool = False) -> bool:
+    """Sampled requests are profiled; the X-Profile header only counts for admin callers."""
+    if allow_header and headers.get(PROFILE_HEADER) == "1":
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval and counts collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format, ready for flamegraph.pl or speedscope."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """
+    Profiles one request with cProfile plus a stack sampler on the event-loop thread.
+    Note: in an async server the loop interleaves requests, so concurrent work shows up too.
+    """
+
+    def __init__(self, label: str):
+        self.label = re.sub(r"[^\w\-]+", "_", label).strip("_") or "request"
+        self.profile = None
+        self.sampler = None
+
+    def start(self) -> bool:
+        if not _profile_lock.acquire(blocking=False):
+            return False
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident())
+        self.sampler.start()
+        self.profile.enable()
+        return True
+
+    def stop(self) -> str:
+        """Stop profiling and write <name>.prof and <name>.folded. Returns the profile name."""
+        try:
+            self.profile.disable()
+            self.sampler.stop()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}_{self.label}_{uuid.uuid4().hex[:6]}"
+            self.profile.dump_stats(os.path.join(PROFILE_DIR, f"{name}.prof"))
+            with open(os.path.join(PROFILE_DIR, f"{name}.folded"), "w", encoding="utf-8") as f:
+                f.write(self.sampler.collapsed())
+            prune_profiles()
+            return name
+        finally:
+            _profile_lock.release()
+
+
+def list_profiles():
+    """Most recent profile files first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    files = [f for f in os.listdir(PROFILE_DIR) if PROFILE_NAME_RE.match(f)]
+    files.sort(key=lambda f: os.path.getmtime(os.path.join(PROFILE_DIR, f)), reverse=True)
+    return [
+        {"file": f, "bytes": os.path.getsize(os.path.join(PROFILE_DIR, f)),
+         "created": time.strftime("%Y-%m-%d %H:%M:%S",
+                                  time.localtime(os.path.getmtime(os.path.join(PROFILE_DIR, f))))}
+        for f in files
+    ]
+
+
+def profile_path(filename: str):
+    """Resolve a profile file name inside PROFILE_DIR, or None if invalid/missing."""
+    if not PROFILE_NAME_RE.match(filename):
+        return None
+    path = os.path.join(PROFILE_DIR, filename)
+    return path if os.path.isfile(path) else None
+
+
+def prune_profiles():
+    """Keep only the newest MAX_PROFILES profiles (each profile is a .prof + .folded pair)."""
+    files = list_profiles()
+    for entry in files[MAX_PROFILES * 2:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, entry["file"]))
+        except OSError:
+            pass
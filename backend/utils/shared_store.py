@@ -0,0 +1,207 @@
+# shared_store.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# "local": in-process dicts (single worker / development stand-in)
+# "sqlite": one SQLite file shared by all workers on the host (multi-worker mode)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "local")
+STATE_DB = os.getenv("STATE_DB", "farmwise_state.db")
+
+# Bounded SQLite namespaces trim their oldest keys once every this many writes.
+PRUNE_EVERY = 100
+
+
+class LocalStore:
+    """In-process key/value namespace with LRU eviction. Not shared between workers."""
+
+    def __init__(self, namespace: str, max_entries: int = None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def _put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while self.max_entries and len(self.data) > self.max_entries:
+            self.data.popitem(last=False)
+
+    def set(self, key, value):
+        with self.lock:
+            self._put(key, value)
+
+    def setdefault(self, key, value):
+        with self.lock:
+            if key not in self.data:
+                self._put(key, value)
+            return self.data[key]
+
+    def update(self, key, fn, default=None):
+        """Atomically replace the value at `key` with fn(current value or default) and return it."""
+        with self.lock:
+            value = fn(self.data.get(key, default))
+            self._put(key, value)
+            return value
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.data.pop(key, default)
+
+    def append(self, key, item):
+        with self.lock:
+            self.data.setdefault(key, []).append(item)
+            self.data.move_to_end(key)
+
+    def items(self, prefix: str = ""):
+        with self.lock:
+            return [(k, v) for k, v in self.data.items() if k.startswith(prefix)]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SQLiteStore:
+    """
+    Key/value namespace backed by SQLite (WAL mode), safe to use from several worker
+    processes at once. Values are stored as JSON.
+    """
+
+    def __init__(self, namespace: str, max_entries: int = None, path: str = STATE_DB):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.path = path
+        self.local = threading.local()
+        self.writes = 0
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "namespace TEXT, key TEXT, value TEXT, updated REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS kv_updated ON kv (namespace, updated)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per process and thread: connections must not cross a fork.
+        conn = getattr(self.local, "conn", None)
+        if conn is None or getattr(self.local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        row = self._select(self._conn(), key)
+        return json.loads(row[0]) if row else default
+
+    def _put(self, conn, key, value):
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value, ensure_ascii=False), time.time())
+        )
+
+    def _prune(self):
+        """Trim a bounded namespace to its newest max_entries keys (amortized over PRUNE_EVERY writes)."""
+        self.writes += 1
+        if not self.max_entries or self.writes % PRUNE_EVERY:
+            return
+        self._conn().execute(
+            "DELETE FROM kv WHERE namespace = ? AND key NOT IN ("
+            "SELECT key FROM kv WHERE namespace = ? ORDER BY updated DESC LIMIT ?)",
+            (self.namespace, self.namespace, self.max_entries)
+        )
+
+    def _transaction(self, fn):
+        """Run fn(conn) inside a write transaction, so read-modify-write is atomic across workers."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _select(self, conn, key):
+        return conn.execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+
+    def set(self, key, value):
+        self._put(self._conn(), key, value)
+        self._prune()
+
+    def setdefault(self, key, value):
+        def insert_missing(conn):
+            row = self._select(conn, key)
+            if row:
+                return json.loads(row[0])
+            self._put(conn, key, value)
+            return value
+        result = self._transaction(insert_missing)
+        self._prune()
+        return result
+
+    def update(self, key, fn, default=None):
+        """Atomically replace the value at `key` with fn(current value or default) and return it."""
+        def read_modify_write(conn):
+            row = self._select(conn, key)
+            value = fn(json.loads(row[0]) if row else default)
+            self._put(conn, key, value)
+            return value
+        result = self._transaction(read_modify_write)
+        self._prune()
+        return result
+
+    def pop(self, key, default=None):
+        def select_and_delete(conn):
+            row = self._select(conn, key)
+            if row:
+                conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key))
+            return row
+        row = self._transaction(select_and_delete)
+        return json.loads(row[0]) if row else default
+
+    def append(self, key, item):
+        """Atomically append `item` to the list stored at `key` (read-modify-write in one transaction)."""
+        self.update(key, lambda values: values + [item], default=[])
+
+    def items(self, prefix: str = ""):
+        rows = self._conn().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND key LIKE ? ESCAPE '\\' ORDER BY key",
+            (self.namespace, prefix.replace("%", r"\%").replace("_", r"\_") + "%")
+        ).fetchall()
+        return [(k, json.loads(v)) for k, v in rows]
+
+    def __contains__(self, key):
+        return self._conn().execute(
+            "SELECT 1 FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone() is not None
+
+    def __len__(self):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM kv WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+
+def get_store(namespace: str, max_entries: int = None):
+    """Store for `namespace` on the configured backend (STATE_BACKEND)."""
+    if STATE_BACKEND == "sqlite":
+        return SQLiteStore(namespace, max_entries=max_entries)
+    return LocalStore(namespace, max_entries=max_entries)
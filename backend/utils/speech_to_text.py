@@ -1,6 +1,7 @@
 import os
 from groq import Groq
 import tempfile
+import asyncio
 from fastapi import UploadFile
 
 client = Groq(api_key=os.getenv("GROQ_API_KEY"))
@@ -10,20 +11,34 @@ async def convert_speech_to_text(file: UploadFile, language: str = None):
     Convert uploaded audio to text using Groq's Whisper model.
     Handles fallback and auto-detect gracefully.
     """
+    try:
+        return await transcribe_audio_bytes(await file.read(), language=language)
+    except Exception as e:
+        print(f"❌ Speech-to-text error: {e}")
+        return "Error transcribing speech"
+
+
+async def transcribe_audio_bytes(audio_bytes: bytes, language: str = None, suffix: str = ".wav"):
+    """
+    Transcribe raw audio bytes (e.g. one WAV segment of a streaming voice session).
+    Runs the blocking Groq call in a worker thread so the event loop keeps serving.
+    """
     temp_path = None
     try:
-        # Save uploaded audio to temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-            temp_audio.write(await file.read())
+        # Save audio to temp file
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_audio:
+            temp_audio.write(audio_bytes)
             temp_path = temp_audio.name
 
         # Open file for transcription
-        with open(temp_path, "rb") as audio_file:
-            params = {"model": "whisper-large-v3", "file": audio_file}
-            if language:
-                params["language"] = language
+        def _transcribe():
+            with open(temp_path, "rb") as audio_file:
+                params = {"model": "whisper-large-v3", "file": audio_file}
+                if language:
+                    params["language"] = language
+                return client.audio.transcriptions.create(**params)
 
-            transcript = client.audio.transcriptions.create(**params)
+        transcript = await asyncio.to_thread(_transcribe)
 
         # Return text output
         return getattr(transcript, "text", str(transcript))
@@ -37,4 +52,4 @@ async def convert_speech_to_text(file: UploadFile, language: str = None):
             try:
                 os.remove(temp_path)
             except Exception:
-                pass
\ No newline at end of file
+                pass
@@ -0,0 +1,159 @@
+# voice_session.py
+import io
+import os
+import wave
+import asyncio
+import numpy as np
+from utils.admission_control import TokenBucket
+
+# Streaming audio format expected from clients: 16-bit little-endian mono PCM
+SAMPLE_RATE = int(os.getenv("VOICE_SAMPLE_RATE", "16000"))
+FRAME_MS = 20
+
+# A short pause closes a segment (sent to Whisper right away);
+# a longer pause ends the utterance (the turn is processed).
+ENERGY_THRESHOLD = float(os.getenv("VOICE_ENERGY_THRESHOLD", "500"))
+SEGMENT_PAUSE_MS = int(os.getenv("VOICE_SEGMENT_PAUSE_MS", "350"))
+UTTERANCE_PAUSE_MS = int(os.getenv("VOICE_UTTERANCE_PAUSE_MS", "1000"))
+MAX_SEGMENT_SECONDS = 15
+
+# Whisper spend per session: at most this many segments transcribing at once,
+# and a segment budget of SEGMENTS_PER_SECOND with bursts of SEGMENT_BURST.
+MAX_PENDING_SEGMENTS = int(os.getenv("VOICE_MAX_PENDING_SEGMENTS", "4"))
+SEGMENTS_PER_SECOND = float(os.getenv("VOICE_SEGMENTS_PER_SECOND", "1"))
+SEGMENT_BURST = float(os.getenv("VOICE_SEGMENT_BURST", "10"))
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Wrap raw 16-bit mono PCM in a WAV container for transcription."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class PauseSegmenter:
+    """
+    Splits a stream of PCM frames into speech segments using frame energy.
+    feed() returns a list of events: ("segment", pcm_bytes) or ("utterance_end", None).
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, energy_threshold: float = ENERGY_THRESHOLD,
+                 segment_pause_ms: int = SEGMENT_PAUSE_MS, utterance_pause_ms: int = UTTERANCE_PAUSE_MS):
+        self.frame_bytes = int(sample_rate * FRAME_MS / 1000) * 2
+        self.max_segment_bytes = sample_rate * 2 * MAX_SEGMENT_SECONDS
+        self.energy_threshold = energy_threshold
+        self.segment_pause_ms = segment_pause_ms
+        self.utterance_pause_ms = utterance_pause_ms
+        self.pending = bytearray()
+        self.segment = bytearray()
+        self.silence_ms = 0
+        self.segment_has_speech = False
+        self.utterance_has_speech = False
+
+    def feed(self, data: bytes):
+        events = []
+        self.pending.extend(data)
+        while len(self.pending) >= self.frame_bytes:
+            frame = bytes(self.pending[:self.frame_bytes])
+            del self.pending[:self.frame_bytes]
+            events.extend(self._process_frame(frame))
+        return events
+
+    def _process_frame(self, frame: bytes):
+        events = []
+        samples = np.frombuffer(frame, dtype="<i2").astype(np.float32)
+        rms = float(np.sqrt(np.mean(samples ** 2))) if samples.size else 0.0
+
+        if rms >= self.energy_threshold:
+            self.silence_ms = 0
+            self.segment_has_speech = True
+            self.utterance_has_speech = True
+            self.segment.extend(frame)
+        else:
+            self.silence_ms += FRAME_MS
+            if self.segment_has_speech:
+                self.segment.extend(frame)
+                if self.silence_ms >= self.segment_pause_ms:
+                    events.extend(self._emit_segment())
+            if self.utterance_has_speech and self.silence_ms >= self.utterance_pause_ms:
+                self.utterance_has_speech = False
+                events.append(("utterance_end", None))
+
+        if len(self.segment) >= self.max_segment_bytes:
+            events.extend(self._emit_segment())
+        return events
+
+    def _emit_segment(self):
+        if not self.segment_has_speech:
+            return []
+        segment = bytes(self.segment)
+        self.segment = bytearray()
+        self.segment_has_speech = False
+        return [("segment", segment)]
+
+    def flush(self):
+        """Force the end of the current utterance (client said it stopped talking)."""
+        events = self._emit_segment()
+        self.pending = bytearray()
+        self.silence_ms = 0
+        if self.utterance_has_speech or events:
+            self.utterance_has_speech = False
+            events.append(("utterance_end", None))
+        return events
+
+
+class VoiceSession:
+    """
+    In-memory state for one WebSocket voice session: language, user and conversation
+    context are loaded once at connect instead of re-read from the memory store each turn.
+    """
+
+    def __init__(self, user_id: str = "guest", lang: str = None, context=None):
+        self.user_id = user_id
+        self.lang = lang
+        self.context = list(context or [])
+        self.segmenter = PauseSegmenter()
+        self.transcriptions = []  # transcription tasks for the current utterance
+        self.active = set()  # transcription tasks still running, across utterances
+        self.segment_budget = TokenBucket(SEGMENTS_PER_SECOND, SEGMENT_BURST)
+        self.turn_task = None  # latest turn (LLM + TTS) running in the background
+
+    def segment_rejection(self):
+        """Reason to refuse transcribing another segment right now, or None."""
+        if len(self.active) >= MAX_PENDING_SEGMENTS:
+            return "Too many segments waiting for transcription."
+        if self.segment_budget.take() > 0:
+            return "Audio is arriving faster than this session may transcribe."
+        return None
+
+    def add_segment(self, task: asyncio.Task):
+        self.transcriptions.append(task)
+        self.active.add(task)
+        task.add_done_callback(self.active.discard)
+
+    def take_utterance(self):
+        """Detach the current utterance's transcription tasks; new segments start a new utterance."""
+        tasks, self.transcriptions = self.transcriptions, []
+        return tasks
+
+    @staticmethod
+    async def collect_utterance(tasks) -> str:
+        """Wait for an utterance's segment transcriptions (in order) and join them."""
+        texts = await asyncio.gather(*tasks, return_exceptions=True)
+        return " ".join(
+            t.strip() for t in texts if isinstance(t, str) and "Error transcribing" not in t
+        ).strip()
+
+    def remember_turn(self, user_text: str, response: str):
+        self.context.append({"role": "user", "message": user_text})
+        self.context.append({"role": "assistant", "message": response})
+
+    def cancel(self):
+        for task in [*self.transcriptions, *self.active, self.turn_task]:
+            if task is not None:
+                task.cancel()
+        self.transcriptions = []
@@ -0,0 +1,109 @@
+# worker_metrics.py
+import os
+import time
+import asyncio
+from utils.shared_store import get_store
+
+FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# Workers that have not reported for this long are considered gone (restarted or killed).
+STALE_SECONDS = max(30.0, FLUSH_SECONDS * 6)
+
+
+class WorkerMetrics:
+    """
+    Request counters for the current worker process, periodically published to the
+    shared store so any worker can report per-worker and aggregate numbers.
+
+    sections maps a name to (collect, combine): collect() is published with every
+    snapshot and combine(list of collected values) builds the server-wide total.
+    """
+
+    def __init__(self, sections: dict = None):
+        self.store = get_store("worker_metrics")
+        self.sections = sections or {}
+        self.reset()
+        os.register_at_fork(after_in_child=self.reset)  # workers forked from a preloaded master
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.last_flush = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.paths = {}
+
+    def record(self, path: str, status_code: int, elapsed: float):
+        self.requests += 1
+        if status_code >= 500:
+            self.errors += 1
+        self.latency_total += elapsed
+        self.latency_max = max(self.latency_max, elapsed)
+        self.paths[path] = self.paths.get(path, 0) + 1
+        if time.time() - self.last_flush >= FLUSH_SECONDS:
+            self.flush()
+
+    def snapshot(self) -> dict:
+        snapshot = {
+            "pid": self.pid,
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_latency_ms": round(self.latency_total / self.requests * 1000, 2) if self.requests else 0.0,
+            "max_latency_ms": round(self.latency_max * 1000, 2),
+            "paths": dict(self.paths),
+            "reported_at": time.time()
+        }
+        for name, (collect, _) in self.sections.items():
+            snapshot[name] = collect()
+        return snapshot
+
+    def flush(self):
+        self.last_flush = time.time()
+        try:
+            self.store.set(f"worker:{self.pid}", self.snapshot())
+        except Exception as e:
+            print(f"⚠️ Failed to publish worker metrics: {e}")
+
+    async def publish_forever(self):
+        """Flush every FLUSH_SECONDS, so idle workers keep reporting instead of going stale."""
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            if time.time() - self.last_flush >= FLUSH_SECONDS:
+                self.flush()
+
+    def workers(self) -> list:
+        """Fresh snapshots of all live workers (this one included); stale ones are dropped."""
+        self.flush()
+        now = time.time()
+        workers = []
+        for key, snapshot in self.store.items("worker:"):
+            if now - snapshot.get("reported_at", 0) <= STALE_SECONDS:
+                workers.append(snapshot)
+            else:
+                self.store.pop(key)
+        return workers
+
+    def aggregate(self) -> dict:
+        """Per-worker snapshots (this worker fresh, others as last published) plus totals."""
+        workers = self.workers()
+        requests = sum(w["requests"] for w in workers)
+        latency_total = sum(w["avg_latency_ms"] * w["requests"] for w in workers)
+        totals = {
+            "worker_count": len(workers),
+            "requests": requests,
+            "errors": sum(w["errors"] for w in workers),
+            "avg_latency_ms": round(latency_total / requests, 2) if requests else 0.0,
+            "max_latency_ms": max((w["max_latency_ms"] for w in workers), default=0.0),
+            "workers": sorted(workers, key=lambda w: w["pid"])
+        }
+        for name in self.sections:
+            totals[name] = self.combine(name, workers)
+        return totals
+
+    def combine(self, name: str, workers: list = None):
+        """Server-wide value of one section across all live workers."""
+        workers = self.workers() if workers is None else workers
+        _, combine = self.sections[name]
+        return combine([w[name] for w in workers if name in w])
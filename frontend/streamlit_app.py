@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 import os
 import tempfile
+import uuid
 import joblib
 import numpy as np
 from datetime import datetime
@@ -37,6 +38,10 @@ if "selected_lang" not in st.session_state:
     st.session_state["selected_lang"] = None
 if "last_audio" not in st.session_state:
     st.session_state["last_audio"] = None
+if "user_id" not in st.session_state:
+    # One id per browser session: the backend rate-limits and remembers conversations per
+    # user_id, and every request arrives from this server's IP.
+    st.session_state["user_id"] = f"web-{uuid.uuid4().hex[:12]}"
 
 
 # --- Load model silently (no UI warnings) ---
@@ -70,7 +75,7 @@ st.markdown("---")
 # --- Backend communication ---
 def call_voice_chat(file=None, text_override=None, lang: str = None):
     try:
-        data = {"user_id": "guest"}
+        data = {"user_id": st.session_state["user_id"]}
         if lang:
             data["lang"] = lang
 